@@ -4,14 +4,15 @@
 # Imports #
 ###########
 
-import re
 import os
+import stat
+import errno
 import sys
+import math
+import mmap
 import time
-import signal
+import struct
 import argparse
-import textwrap
-from pathlib import Path
 
 ####################
 # Optional Imports #
@@ -31,6 +32,9 @@ except ModuleNotFoundError:
 RED='\033[00;31m'
 NORMAL='\033[0m'
 
+# Bash escape code that clears the rest of the line
+CLEAR_LINE='\033[K'
+
 # Number of bytes written
 BYTES_WRITTEN = 0
 
@@ -40,19 +44,51 @@ START_TIME = 0
 # Our progress bar
 BAR = None
 
+# What a size argument (--bs, --ts) looks like: a number, with an optional suffix
+# Note: Compiled by size() the first time it's needed
+SIZE_REGEX = None
+
+# How many bytes each size suffix stands for
+# Note: Both cases are listed, so looking up a suffix doesn't need str.lower()
+SIZE_MULTIPLIERS = {
+    '': 1,
+    'k': 1024, 'K': 1024,
+    'm': 1024 ** 2, 'M': 1024 ** 2,
+    'g': 1024 ** 3, 'G': 1024 ** 3,
+    't': 1024 ** 4, 'T': 1024 ** 4,
+    'p': 1024 ** 5, 'P': 1024 ** 5,
+    'e': 1024 ** 6, 'E': 1024 ** 6,
+    'z': 1024 ** 7, 'Z': 1024 ** 7,
+}
+
+# Block size used for --count and --seek if --bs isn't given
+DEFAULT_BLOCK_SIZE = 4 * 1024 ** 2
+
+# If --bs isn't given, we start copying in chunks of AUTO_BLOCK_SIZE_START
+# bytes, and keep doubling that while it makes us faster, up to
+# AUTO_BLOCK_SIZE_MAX bytes
+AUTO_BLOCK_SIZE_START = 64 * 1024
+AUTO_BLOCK_SIZE_MAX = 16 * 1024 ** 2
+
+# Linux ioctl that gets the size of a block device in bytes, as a u64
+# Source: _IOR(0x12, 114, size_t) in <linux/fs.h>
+BLKGETSIZE64 = 0x80081272
+
+# Errors that mean the kernel can't copy between these two files for us,
+# and we should fall back to reading and writing the data ourselves
+COPY_FALLBACK_ERRNOS = (errno.EINVAL, errno.ENOSYS, errno.EXDEV, errno.EOPNOTSUPP)
+
 ##################
 # Ctrl+C Handler #
 ##################
 
 # Define the handler
+# Note: It's registered in main, once we actually start copying data
+# Note: Exiting unwinds copy_data(), which records how much it copied on
+# its way out, and then main shows the user the results
 def signal_handler(*args):
-    print("\n")
-    show_results()
     sys.exit(0)
 
-# Register the handler
-signal.signal(signal.SIGINT, signal_handler)
-
 #############
 # Functions #
 #############
@@ -74,47 +110,428 @@ def update_status(bytes_written, total_bytes, elapsed_time):
     """
 
     if progressbar:
-        BAR.update(BYTES_WRITTEN)
+        BAR.update(bytes_written)
     else:
-        if elapsed_time > 60:
-            print(f"{bytes_written} bytes ({sizeof_fmt(bytes_written)}) copied, {human_readable_time(elapsed_time)} ({elapsed_time:.2f} s), {rate(bytes_written, elapsed_time)}")
+        # On a terminal, overwrite the last status line, rather than adding
+        # a new one
+        # Note: Goes to stderr, since stdout may be where the data is going
+        if sys.stderr.isatty():
+            sys.stderr.write(f"\r{status_line(bytes_written, elapsed_time)}{CLEAR_LINE}")
         else:
-            print(f"{bytes_written} bytes ({sizeof_fmt(bytes_written)}) copied, {elapsed_time:.2f} s, {rate(bytes_written, elapsed_time)}")
+            sys.stderr.write(f"{status_line(bytes_written, elapsed_time)}\n")
+        sys.stderr.flush()
+
+def status_line(bytes_written, elapsed_time):
+    """
+        Returns a line describing how much data we've written, how long it
+        took, and how fast that was
+    """
+
+    # Only spell out the time once there's at least a second of it
+    if elapsed_time >= 1:
+        time_taken = f"{human_readable_time(elapsed_time)} ({elapsed_time:.2f} s)"
+    else:
+        time_taken = f"{elapsed_time:.2f} s"
+
+    return f"{bytes_written} bytes ({sizeof_fmt(bytes_written)}) copied, {time_taken}, {rate(bytes_written, elapsed_time)}"
 
 def sizeof_fmt(num, suffix='B'):
     """
         Converts filesize to human-readable form
-        Source: https://stackoverflow.com/a/1094933/6423456
     """
 
-    for unit in ['','Ki','Mi','Gi','Ti','Pi','Ei','Zi']:
-        if abs(num) < 1024.0:
-            return f"{num:3.1f} {unit}{suffix}"
-        num /= 1024.0
+    UNITS = ('', 'Ki', 'Mi', 'Gi', 'Ti', 'Pi', 'Ei', 'Zi', 'Yi')
+
+    # Each unit is 2^10 times bigger than the last, so the number of bits
+    # in num tells us which unit to use, without dividing in a loop
+    power = min(max(int(num).bit_length() - 1, 0) // 10, len(UNITS) - 1)
 
-    return "%.1f%s%s" % (num, 'Yi', suffix)
+    return f"{num / (1 << (power * 10)):3.1f} {UNITS[power]}{suffix}"
 
 def show_results():
     """
         Shows how much data we've written, and how much time has elapsed
     """
 
-    current_time = time.perf_counter()
-    elapsed_time = current_time - START_TIME
+    # We may not have started copying yet
+    if START_TIME:
+        elapsed_time = time.perf_counter() - START_TIME
+    else:
+        elapsed_time = 0
+
+    # On a terminal, overwrite the last status line (if any), and end it
+    if sys.stderr.isatty():
+        sys.stderr.write(f"\r{status_line(BYTES_WRITTEN, elapsed_time)}{CLEAR_LINE}\n")
+    else:
+        sys.stderr.write(f"{status_line(BYTES_WRITTEN, elapsed_time)}\n")
+    sys.stderr.flush()
+
+def blockdev_size(f):
+    """
+        Return the size in bytes of the block device open as f
+
+        On Linux, the kernel tells us with the BLKGETSIZE64 ioctl.
+        Everywhere else (or if that fails), we seek to the end of the
+        device, and back.
+    """
+
+    if sys.platform.startswith("linux"):
+        import fcntl
+
+        try:
+            return struct.unpack('Q', fcntl.ioctl(f.fileno(), BLKGETSIZE64, bytes(8)))[0]
+        except OSError:
+            pass
+
+    position = os.lseek(f.fileno(), 0, os.SEEK_CUR)
+    size = os.lseek(f.fileno(), 0, os.SEEK_END)
+    os.lseek(f.fileno(), position, os.SEEK_SET)
+
+    return size
+
+class ReadAhead:
+    """
+        When we copy the data ourselves, a background thread reads ahead
+        into the other buffer while we write out the current one (see
+        start_reader()). This keeps track of where that's at.
+
+        Attributes:
+            buffers:
+                list of memoryviews of the reusable buffers we read into
+
+            requests, results:
+                the reader thread's queues (see start_reader())
+                None until the first time we need them
+
+            pending_data:
+                memoryview of data the reader thread has read, that we
+                haven't written out yet
+
+            pending_buf:
+                the buffer pending_data is in
+
+            idle_buffers:
+                list of buffers the reader thread isn't reading into, and
+                that have nothing left to write out
+
+            in_flight:
+                int of how many bytes we've asked the reader thread for,
+                that it hasn't read yet
+
+            read_multiple:
+                int every read has to be a multiple of (ex. the page size
+                for O_DIRECT)
+    """
+
+    def __init__(self, buffers, read_multiple=1):
+        self.buffers = buffers
+        self.requests = None
+        self.results = None
+        self.pending_data = None
+        self.pending_buf = None
+        self.idle_buffers = list(buffers)
+        self.in_flight = 0
+        self.read_multiple = read_multiple
+
+def copy_file_range_block(src, dst, data_left, read_ahead, block_size):
+    """
+        Copies up to block_size bytes (but no more than data_left) from src
+        to dst with copy_file_range, so the data never has to pass through
+        Python
+
+        Takes the same arguments as read_write_block(), so copy_data() can
+        use either one
+
+        Returns the number of bytes copied (0 means src is out of data)
+        None if the kernel can't copy between these two files, and we
+        should use read_write_block() instead
+    """
+
+    try:
+        return os.copy_file_range(src.fileno(), dst.fileno(), min(data_left, block_size))
+    except OSError as e:
+        if e.errno not in COPY_FALLBACK_ERRNOS:
+            raise
+
+        return None
+
+def sendfile_block(src, dst, data_left, read_ahead, block_size):
+    """
+        Same as copy_file_range_block(), but with sendfile
+    """
+
+    try:
+        return os.sendfile(dst.fileno(), src.fileno(), None, min(data_left, block_size))
+    except OSError as e:
+        if e.errno not in COPY_FALLBACK_ERRNOS:
+            raise
+
+        return None
+
+def read_write_block(src, dst, data_left, read_ahead, block_size):
+    """
+        Copies up to block_size bytes (but no more than data_left) from src
+        to dst by reading and writing the data ourselves
+
+        A background thread reads src into the buffers of read_ahead (a
+        ReadAhead) block_size bytes at a time, while we write out whatever
+        it read last. It's never asked for more than data_left in total,
+        so whatever comes after that in src (ex. the rest of stdin) is left
+        for the next program to read.
+
+        Returns the number of bytes copied (0 means src is out of data)
+    """
+
+    # Start reading ahead the first time we get here
+    if read_ahead.requests is None:
+        read_ahead.requests, read_ahead.results = start_reader(src)
+
+    # Once we've written out everything in a buffer, have the reader
+    # thread refill it, and move on to the one it filled in the meantime
+    if not read_ahead.pending_data:
+        if read_ahead.pending_buf is not None:
+            read_ahead.idle_buffers.append(read_ahead.pending_buf)
+            read_ahead.pending_buf = None
+
+        # Only ask for as much as we still need, counting what's already
+        # been asked for
+        # Note: If a read comes up short, the rest of what it was asked
+        # for is asked for again here, once we get to it
+        # Note: Rounding up to read_multiple can read a bit past data_left,
+        # but that's only needed for O_DIRECT, which doesn't work on pipes
+        # anyway, and we never write out more than data_left
+        read_multiple = read_ahead.read_multiple
+        while read_ahead.idle_buffers and data_left > read_ahead.in_flight:
+            request_size = -(-(data_left - read_ahead.in_flight) // read_multiple) * read_multiple
+            request_size = min(block_size, request_size)
+            read_ahead.requests.put((read_ahead.idle_buffers.pop(), request_size))
+            read_ahead.in_flight += request_size
+
+        result = read_ahead.results.get()
+        if isinstance(result, Exception):
+            raise result
+
+        read_ahead.pending_buf, request_size, bytes_read = result
+        read_ahead.pending_data = read_ahead.pending_buf[:bytes_read]
+        read_ahead.in_flight -= request_size
+
+    data = read_ahead.pending_data[:min(data_left, block_size)]
+    read_ahead.pending_data = read_ahead.pending_data[len(data):]
+
+    write_all(dst, data)
+
+    return len(data)
+
+def write_all(dst, data):
+    """
+        Writes out all of data (a memoryview) to dst
+
+        dst is unbuffered, so a write can be cut short - we keep going
+        until it's all out
+    """
+
+    while data:
+        data = data[os.write(dst.fileno(), data):]
+
+def start_reader(src):
+    """
+        Starts a background thread that reads from src, so reading the
+        next block overlaps with writing out the current one
+
+        Returns 2 queues:
+            requests:
+                put (buf, count) on it to have up to count bytes read
+                into the memoryview buf
+
+            results:
+                (buf, count, bytes_read) for every request, in order
+                bytes_read is 0 once src is out of data, after which the
+                thread stops
+                If reading fails, the exception is put on it instead
+    """
+
+    # Only pay for importing these if the kernel can't copy the data for us
+    import queue
+    import threading
+
+    requests = queue.Queue()
+    results = queue.Queue()
+
+    thread = threading.Thread(target=read_blocks, args=(src, requests, results))
+
+    # Don't wait for a read that's blocked (ex. on a pipe) when we exit
+    thread.daemon = True
+    thread.start()
+
+    return requests, results
+
+def read_blocks(src, requests, results):
+    """
+        Body of the reader thread (see start_reader())
+    """
+
+    while True:
+        buf, count = requests.get()
+
+        try:
+            bytes_read = src.readinto(buf[:count])
+        except Exception as e:
+            results.put(e)
+            return
+
+        results.put((buf, count, bytes_read))
+
+        if not bytes_read:
+            return
+
+def copy_data(src, dst, copy, buffers, block_size, max_block_size, bytes_to_write, read_multiple=1):
+    """
+        Copies everything from src to dst, a block at a time, showing
+        progress along the way
+
+        Params:
+            copy:
+                function that copies each block: copy_file_range_block(),
+                sendfile_block() or read_write_block()
+                If the kernel can't copy the data for us, we permanently
+                switch to read_write_block()
+
+            buffers:
+                list of memoryviews to read into (see ReadAhead)
+
+            block_size:
+                int of how many bytes to copy at a time
+
+            max_block_size:
+                if bigger than block_size, the block size is doubled up
+                to this while that makes copying faster
+
+            bytes_to_write:
+                int of how many bytes to copy in total
+                None to copy until src runs out of data
+
+            read_multiple:
+                int every read from src has to be a multiple of (see
+                ReadAhead)
+
+        Note: This is the hot loop, so everything it uses per block is
+        kept in local variables, which Python looks up faster than
+        globals and attributes
+    """
+
+    global BYTES_WRITTEN
 
-    if elapsed_time > 60:
-        print(f"{BYTES_WRITTEN} bytes ({sizeof_fmt(BYTES_WRITTEN)}) copied, {human_readable_time(elapsed_time)} ({elapsed_time:.2f} s), {rate(BYTES_WRITTEN, elapsed_time)}")
+    perf_counter = time.perf_counter
+
+    # Where the reader thread is at, if the kernel can't copy the data for us
+    read_ahead = ReadAhead(buffers, read_multiple)
+
+    # We can only drop what we've read from the page cache if we can tell
+    # how far into src we are (ex. not for a pipe)
+    src_seekable = src.seekable()
+
+    # Keeps track of the last time we updated the status
+    # We don't want to update it too often, or we'll slow down IO operations
+    start_time = START_TIME
+    last_status_update = start_time
+
+    # Keeps track of how fast the last block was, while we're still
+    # tuning the block size
+    tuning_block_size = block_size < max_block_size
+    last_Bps = 0
+    block_start = perf_counter()
+
+    # With small blocks, checking the clock after every one of them adds
+    # up, so only check it about every 64 KiB worth of blocks
+    # Note: Rounded down to a power of 2, so we can check it with a mask
+    blocks_copied = 0
+    clock_poll_mask = (1 << (max(1, 65536 // block_size).bit_length() - 1)) - 1
+
+    # How much data we have left to write
+    # Note: If we don't know, there's no limit, so the last block is the
+    # only one that ever gets cut short, without checking which case
+    # we're in for every block
+    if bytes_to_write is None:
+        data_left = math.inf
     else:
-        print(f"{BYTES_WRITTEN} bytes ({sizeof_fmt(BYTES_WRITTEN)}) copied, {elapsed_time:.2f} s, {rate(BYTES_WRITTEN, elapsed_time)}")
+        data_left = bytes_to_write
+
+    # Write data
+    bytes_written = 0
+    try:
+        while data_left:
+            # Write buf data
+            bytes_copied = copy(src, dst, data_left, read_ahead, block_size)
+
+            if not bytes_copied:
+                # The kernel can't copy the data for us, so do it ourselves
+                # from here on
+                if bytes_copied is None:
+                    copy = read_write_block
+                    continue
+
+                # Source ran out of data
+                break
+
+            # Record the total data written
+            bytes_written += bytes_copied
+            data_left -= bytes_copied
+            blocks_copied += 1
+
+            # Skip checking the clock, unless we need it to time every
+            # block while tuning the block size
+            if blocks_copied & clock_poll_mask and not tuning_block_size:
+                continue
+
+            now = perf_counter()
+
+            # Keep doubling the block size while it makes us more than 5%
+            # faster, and stick with it once it doesn't
+            if tuning_block_size and bytes_copied == block_size:
+                Bps = bytes_copied / (now - block_start)
+
+                if Bps > last_Bps * 1.05 and block_size < max_block_size:
+                    block_size *= 2
+                    last_Bps = Bps
+                else:
+                    tuning_block_size = False
+
+            block_start = now
+
+            # Update status
+            if now - last_status_update > 1.0:
+                elapsed_time = now - start_time
 
-def blockdev_size(path):
+                update_status(bytes_written, bytes_to_write, elapsed_time)
+                last_status_update = now
+
+                # We won't read what we've already read again, so there's
+                # no point in keeping it in the page cache
+                if src_seekable:
+                    fadvise(src, "DONTNEED", length=os.lseek(src.fileno(), 0, os.SEEK_CUR))
+    finally:
+        # Let show_results() know how far we got, even if we were interrupted
+        BYTES_WRITTEN = bytes_written
+
+def fadvise(f, advice, offset=0, length=0):
     """
-        Return block device size in bytes
-        Source: https://stackoverflow.com/a/57137214/6423456
+        Tells the kernel how we're going to access f, so it can manage
+        its page cache accordingly
+
+        advice is the name of the hint, without the POSIX_FADV_ prefix
+        (ex. "SEQUENTIAL")
+
+        Hints are optional, so if they aren't supported on this platform
+        or for this type of file (ex. a pipe), they're silently skipped
     """
 
-    with path.open('rb') as f:
-        return f.seek(0, 2) or f.tell()
+    if not hasattr(os, "posix_fadvise"):
+        return
+
+    try:
+        os.posix_fadvise(f.fileno(), offset, length, getattr(os, f"POSIX_FADV_{advice}"))
+    except OSError:
+        pass
 
 def eprint(s, **kwargs):
     """
@@ -122,34 +539,71 @@ def eprint(s, **kwargs):
     """
     print(f"{RED}ERROR{NORMAL}: {s}", file=sys.stderr, **kwargs)
 
-def permissions_check(input_file, output_file):
+def open_input(input_file, direct=False):
     """
-        Make sure we have permissions to read from input_file, and write
-        to output_file
+        Opens input_file for reading (with O_DIRECT if direct is True)
+
+        Rather than checking permissions up front (which costs extra
+        syscalls, and can change by the time we open the file anyway),
+        we just try to open it, and explain what went wrong if we can't
     """
 
-    # Make sure the input file exists
-    if not input_file.exists():
+    flags = os.O_RDONLY
+    if direct:
+        flags |= os.O_DIRECT
+
+    try:
+        fd = os.open(input_file, flags)
+    except FileNotFoundError:
         eprint(f"{input_file} does not exist")
         sys.exit(1)
-
-    # Make sure we have the permissions to read from input_file
-    if not os.access(input_file, os.R_OK):
+    except PermissionError:
         eprint(f"No permission to read {input_file}")
         sys.exit(1)
+    except OSError as e:
+        if direct and e.errno == errno.EINVAL:
+            eprint(f"Cannot open {input_file} with O_DIRECT: {e.strerror}")
+        else:
+            eprint(f"Cannot open {input_file}: {e.strerror}")
+        sys.exit(1)
 
-    # Make sure we have the permissions to write to output_file
-    # Note: If the output file doesn't exist, make sure we have
-    # permissions to write to the dir
-    if output_file.exists():
-        if not os.access(output_file, os.W_OK):
-            eprint(f"No permission to write to {output_file}")
-            sys.exit(1)
-    else:
-        output_dir = output_file.parent
-        if not os.access(output_dir, os.W_OK):
-            eprint(f"No permission to create {output_file}")
-            sys.exit(1)
+    # Unbuffered, since we read whole blocks into our own buffers anyway
+    # Note: This also means closing src doesn't have to wait for a read
+    # that's in progress in the reader thread
+    try:
+        return os.fdopen(fd, "rb", buffering=0)
+    except OSError as e:
+        os.close(fd)
+
+        # Opening a directory works, but we can't read from it
+        if e.errno == errno.EISDIR:
+            eprint(f"{input_file} is an unsupported filetype")
+        else:
+            eprint(f"Cannot open {input_file}: {e.strerror}")
+        sys.exit(1)
+
+def open_output(output_file):
+    """
+        Opens output_file for writing, creating it if it doesn't exist
+
+        Like open_input, we just try it, rather than checking permissions
+        up front
+    """
+
+    try:
+        fd = os.open(output_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    except FileNotFoundError:
+        eprint(f"Cannot create {output_file} - its directory does not exist")
+        sys.exit(1)
+    except PermissionError:
+        eprint(f"No permission to write to {output_file}")
+        sys.exit(1)
+    except OSError as e:
+        eprint(f"Cannot open {output_file}: {e.strerror}")
+        sys.exit(1)
+
+    # Unbuffered, since we write whole blocks from our own buffers anyway
+    return os.fdopen(fd, "wb", buffering=0)
 
 def human_readable_time(seconds):
     """
@@ -184,6 +638,9 @@ def rate(bytes_written, elapsed_time):
         human-readable string
     """
 
+    if not elapsed_time:
+        return f"{sizeof_fmt(0)}/s"
+
     Bps = bytes_written / elapsed_time
     return f"{sizeof_fmt(Bps)}/s"
 
@@ -201,90 +658,100 @@ def size(s):
           Z - Zebibyte
     """
 
-    pattern = '^[0-9]+[kmgtpez]?$'
+    global SIZE_REGEX
+
+    # Plain numbers of bytes (the most common case) don't need the regex
+    if s.isascii() and s.isdigit():
+        return int(s)
+
+    # Only pay for compiling the regex if we get a size to parse
+    if SIZE_REGEX is None:
+        import re
+        SIZE_REGEX = re.compile(r'^([0-9]+)([kmgtpezKMGTPEZ]?)$')
 
     # Make sure it looks right
-    if not re.search(pattern, s, re.IGNORECASE):
+    match = SIZE_REGEX.match(s)
+    if not match:
         raise ValueError()
 
     # Convert to int value in bytes
-    if s.isdigit():
-        return int(s)
-    elif 'k' in s.lower():
-        return int(s[:-1]) * 1024
-    elif 'm' in s.lower():
-        return int(s[:-1]) * 1024 ** 2
-    elif 'g' in s.lower():
-        return int(s[:-1]) * 1024 ** 3
-    elif 't' in s.lower():
-        return int(s[:-1]) * 1024 ** 4
-    elif 'p' in s.lower():
-        return int(s[:-1]) * 1024 ** 5
-    elif 'e' in s.lower():
-        return int(s[:-1]) * 1024 ** 6
-    elif 'z' in s.lower():
-        return int(s[:-1]) * 1024 ** 7
+    number, suffix = match.groups()
+    return int(number) * SIZE_MULTIPLIERS[suffix]
 
 #############
 # Arguments #
 #############
 
-# Define parser
-parser = argparse.ArgumentParser(
-    # Allows newlines in epilog
-    formatter_class=argparse.RawDescriptionHelpFormatter,
-
-    # Adds additional text to the end of the help string
-    epilog=textwrap.dedent("""
-    Sizes:
-        Sizes for --bs and --ts can either be specified in bytes, or
-        with suffixes. Ex:
-            1024    # 1024 bytes
-            1M      # 1 Megabyte (1024 bytes)
-            1G      # 1 Gigabyte (1024 Megabytes)
-"""))
-
-# Add Arguments #
-
-# Note: You can't have an attribute called if (args.if), so it must be
-# renamed with 'dest'
-parser.add_argument(
-    "--if", "--input-file",
-    metavar="FILE",
-    help="Input file to read from (Default: stdin)",
-    default="/dev/stdin",
-    dest="input_file")
-
-# Since '--if' must be renamed (see above), might as well rename '--of' too
-parser.add_argument(
-    "--of", "--output-file",
-    metavar="FILE",
-    help="Output file to write to (Default: stdout)",
-    default="/dev/stdout",
-    dest="output_file")
-
-parser.add_argument(
-    "--bs", "--block-size",
-    metavar="SIZE",
-    help="Specify the blocksize (Default: 4M)",
-    type=size,
-    default="4M")
-
-parser.add_argument(
-    "--ts", "--total-size",
-    metavar="SIZE",
-    type=size,
-    help="Total size in bytes (allows us to show progress when using pipes)")
-
-parser.add_argument(
-    "--count", metavar="BLOCKS",
-    type=int,
-    help="Number of blocks to transfer")
-
-parser.add_argument(
-    "--seek", metavar="BLOCKS",
-    type=int,
-    help="Seek BLOCKS number of blocks before reading data")
+def build_parser():
+    """
+        Defines our command line arguments
+        Returns the argparse parser
+    """
+
+    # Define parser
+    parser = argparse.ArgumentParser(
+        # Allows newlines in epilog
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+
+        # Adds additional text to the end of the help string
+        # Note: Written pre-dedented, so we don't have to import textwrap
+        epilog="""
+Sizes:
+    Sizes for --bs and --ts can either be specified in bytes, or
+    with suffixes. Ex:
+        1024    # 1024 bytes
+        1M      # 1 Megabyte (1024 bytes)
+        1G      # 1 Gigabyte (1024 Megabytes)
+""")
+
+    # Add Arguments #
+
+    # Note: You can't have an attribute called if (args.if), so it must be
+    # renamed with 'dest'
+    parser.add_argument(
+        "--if", "--input-file",
+        metavar="FILE",
+        help="Input file to read from (Default: stdin)",
+        default="/dev/stdin",
+        dest="input_file")
+
+    # Since '--if' must be renamed (see above), might as well rename '--of' too
+    parser.add_argument(
+        "--of", "--output-file",
+        metavar="FILE",
+        help="Output file to write to (Default: stdout)",
+        default="/dev/stdout",
+        dest="output_file")
+
+    parser.add_argument(
+        "--bs", "--block-size",
+        metavar="SIZE",
+        help="Specify the blocksize (Default: 4M for --count and --seek, while "
+             "the size of each transfer is tuned automatically)",
+        type=size)
+
+    parser.add_argument(
+        "--ts", "--total-size",
+        metavar="SIZE",
+        type=size,
+        help="Total size in bytes (allows us to show progress when using pipes)")
+
+    parser.add_argument(
+        "--count", metavar="BLOCKS",
+        type=int,
+        help="Number of blocks to transfer")
+
+    parser.add_argument(
+        "--seek", metavar="BLOCKS",
+        type=int,
+        help="Seek BLOCKS number of blocks before reading data")
+
+    parser.add_argument(
+        "--direct",
+        action="store_true",
+        help="Read with O_DIRECT, bypassing the page cache (--bs must be a multiple of the page size)")
+
+    return parser
 
 ########
 # Main #
@@ -292,18 +759,48 @@ parser.add_argument(
 
 if __name__ == "__main__":
     # Parse sys.argv using the rules defined above
-    args = parser.parse_args()
+    args = build_parser().parse_args()
+
+    # We copy (and allocate buffers) a block at a time, so a block has to
+    # have something in it
+    if args.bs == 0:
+        eprint("--bs must be greater than 0")
+        sys.exit(1)
+
+    # If we weren't given a block size, tune the size of each transfer
+    # ourselves, starting small
+    # Note: Blocks for --count and --seek are still DEFAULT_BLOCK_SIZE
+    if args.bs is None:
+        args.bs = DEFAULT_BLOCK_SIZE
+        block_size = AUTO_BLOCK_SIZE_START
+        max_block_size = AUTO_BLOCK_SIZE_MAX
+    else:
+        block_size = max_block_size = args.bs
+
+    # O_DIRECT needs page-aligned reads
+    if args.direct:
+        if not hasattr(os, "O_DIRECT"):
+            eprint("--direct is not supported on this platform")
+            sys.exit(1)
+
+        if args.bs % mmap.PAGESIZE:
+            eprint(f"--bs must be a multiple of {mmap.PAGESIZE} bytes to use --direct")
+            sys.exit(1)
 
-    # Turn input file and output file into pathlib Path objects
-    input_file = Path(args.input_file)
-    output_file = Path(args.output_file)
+    # Open source for reading
+    # Note: The destination is only opened once we're about to write to it,
+    # so we don't truncate it if we end up erroring out before then
+    src = open_input(args.input_file, args.direct)
 
-    # Ensure permissions for reading from source, and writing to dest
-    permissions_check(input_file, output_file)
+    # Find out what type of file the source is
+    # Note: One fstat on the file we already opened, rather than a stat of
+    # the path for every type we check for
+    input_stat = os.fstat(src.fileno())
+    input_is_pipe = stat.S_ISCHR(input_stat.st_mode) or stat.S_ISFIFO(input_stat.st_mode)
 
-    # Make sure we aren't being asked to seek on a character device
-    if input_file.is_char_device() and args.seek:
-        eprint(f"{input_file} is a character device - cannot seek it")
+    # Make sure we aren't being asked to seek on a character device (or pipe)
+    if input_is_pipe and args.seek:
+        eprint(f"{args.input_file} is a character device or pipe - cannot seek it")
         sys.exit(1)
 
     # Figure out amount of data we want to read/write
@@ -312,19 +809,19 @@ if __name__ == "__main__":
         BYTES_TO_WRITE = args.bs * args.count
     else:
         # Check the type of file it is
-        if input_file.is_block_device():
+        if stat.S_ISBLK(input_stat.st_mode):
             # This is a block device
-            BYTES_TO_WRITE = blockdev_size(input_file)
-        elif input_file.is_file():
+            BYTES_TO_WRITE = blockdev_size(src)
+        elif stat.S_ISREG(input_stat.st_mode):
             # This is a regular file
-            BYTES_TO_WRITE = input_file.stat().st_size
-        elif input_file.is_char_device():
-            # This is a character device - we don't know the number
-            # of bytes to read
+            BYTES_TO_WRITE = input_stat.st_size
+        elif input_is_pipe:
+            # This is a character device (or a pipe) - we don't know the
+            # number of bytes to read
             BYTES_TO_WRITE = None
         else:
             # This is an unsupported file type
-            eprint(f"{input_file} is an unsupported filetype")
+            eprint(f"{args.input_file} is an unsupported filetype")
             sys.exit(1)
 
     # Initialize progress bar
@@ -341,47 +838,56 @@ if __name__ == "__main__":
     # Time we started reading/writing
     START_TIME = time.perf_counter()
 
-    # Keeps track of the last time we updated stdout
-    # We don't want to update it too often, or we'll slow down IO operations
-    last_status_update = time.perf_counter()
+    # Show the user what we've done so far if they hit Ctrl+C
+    import signal
+    signal.signal(signal.SIGINT, signal_handler)
 
-    # Open source for reading, and destination for writing
-    with input_file.open(mode="rb") as src, output_file.open(mode="wb") as dst:
+    # Allocate the 2 buffers we read into (once), for when the kernel can't
+    # copy the data for us
+    # Note: mmap gives us page-aligned buffers, which O_DIRECT needs, and
+    # only uses memory for the parts of them we actually read into
+    buffers = [memoryview(mmap.mmap(-1, max_block_size)) for _ in range(2)]
+
+    # Open destination for writing
+    with src, open_output(args.output_file) as dst:
         # Seek if we need to
+        # Note: --seek is in blocks, not bytes
         if args.seek:
-            src.seek(args.seek)
-
-        # Write data
-        while True:
-            if BYTES_TO_WRITE is None:
-                buf_size = args.bs
-            else:
-                data_left = BYTES_TO_WRITE - BYTES_WRITTEN
-
-                if data_left < args.bs:
-                    buf_size = data_left
-                else:
-                    buf_size = args.bs
-
-            # Check if we're done
-            if not buf_size:
-                break
-
-            # Write buf data
-            buf = src.read(buf_size)
-            dst.write(buf)
-
-            # Record the total data written
-            BYTES_WRITTEN += buf_size
-
-            # Update status
-            now = time.perf_counter()
-            if now - last_status_update > 1.0:
-                current_time = time.perf_counter()
-                elapsed_time = current_time - START_TIME
+            src.seek(args.seek * args.bs, os.SEEK_SET)
+
+        # We read the source once, from start to finish, and want the first
+        # block as soon as possible
+        fadvise(src, "SEQUENTIAL")
+        fadvise(src, "WILLNEED", offset=(args.seek or 0) * args.bs, length=block_size)
+
+        # Find out what type of file the destination is
+        output_stat = os.fstat(dst.fileno())
+        output_is_pipe = stat.S_ISCHR(output_stat.st_mode) or stat.S_ISFIFO(output_stat.st_mode)
+
+        # Unless we could be stuck waiting on a pipe (or terminal) forever,
+        # have reads/writes that get interrupted by Ctrl+C restart in the
+        # kernel, rather than fail with EINTR, and have to be redone by us
+        if not input_is_pipe and not output_is_pipe:
+            signal.siginterrupt(signal.SIGINT, False)
+
+        # Let the kernel copy the data for us if we can
+        # Note: O_DIRECT reads have to go into our own (page-aligned) buffers,
+        # and sendfile can only write to arbitrary files on Linux
+        if args.direct:
+            copy = read_write_block
+        elif (stat.S_ISREG(input_stat.st_mode) and stat.S_ISREG(output_stat.st_mode)
+                and hasattr(os, "copy_file_range")):
+            copy = copy_file_range_block
+        elif hasattr(os, "sendfile") and sys.platform.startswith("linux"):
+            copy = sendfile_block
+        else:
+            copy = read_write_block
 
-                update_status(BYTES_WRITTEN, BYTES_TO_WRITE, elapsed_time)
-                last_status_update = now
+        # O_DIRECT can only read whole pages at a time
+        read_multiple = mmap.PAGESIZE if args.direct else 1
 
-    # Show user the results
-    show_results()
+        # Show user the results (even if they hit Ctrl+C part way)
+        try:
+            copy_data(src, dst, copy, buffers, block_size, max_block_size, BYTES_TO_WRITE, read_multiple)
+        finally:
+            show_results()